@@ -0,0 +1,196 @@
+# (C) Copyright 2012 Nuxeo SAS <http://nuxeo.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+# $Id$
+"""Background workers running the jobs of the remote controller tool.
+
+The jobs themselves are stored in the ZODB by the tool. There is at most one
+worker thread per tool in a Zope process. It opens its own ZODB connection,
+runs the queued jobs one after the other, committing after each call of a
+job, and stops when no job is queued anymore. While a job runs, a heartbeat
+thread shows that the worker is alive, even during a long call. Running jobs
+left behind by a lost worker are run again by the tool's worker once they
+are stale.
+"""
+
+import threading
+
+import transaction
+from zLOG import LOG, DEBUG, ERROR
+from ZODB.POSException import ConflictError
+from AccessControl.SecurityManagement import noSecurityManager
+from Testing.makerequest import makerequest
+
+glog_key = 'CPSRemoteController.jobs'
+
+# Number of times a call of a job is retried when it raises ConflictError
+JOB_CONFLICT_RETRIES = 3
+# Number of seconds between the signs of life of a worker running a call,
+# which must be well below the JOB_STALE_DELAY of the tool
+JOB_HEARTBEAT_INTERVAL = 60
+
+# tool physical path -> running worker
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def startWorker(db, tool_path):
+    """Make sure that a worker runs the jobs of the tool with the given
+    physical path.
+    """
+    _workers_lock.acquire()
+    try:
+        worker = _workers.get(tool_path)
+        if worker is not None:
+            # The worker looks for queued jobs again before stopping
+            worker.requested = True
+            return
+        worker = _workers[tool_path] = JobWorker(db, tool_path)
+        worker.start()
+    finally:
+        _workers_lock.release()
+
+
+class JobWorker(threading.Thread):
+    """Thread running the queued jobs of a tool.
+    """
+
+    def __init__(self, db, tool_path):
+        threading.Thread.__init__(self, name='Remote controller jobs %s'
+                                  % '/'.join(tool_path))
+        self.setDaemon(True)
+        self.db = db
+        self.tool_path = tool_path
+        self.requested = False
+
+    def run(self):
+        while True:
+            try:
+                ran = self.runNextJob()
+            except Exception, e:
+                LOG(glog_key, ERROR, "Error running jobs of %s: %s"
+                    % ('/'.join(self.tool_path), e))
+                ran = False
+            if not ran:
+                _workers_lock.acquire()
+                try:
+                    if not self.requested:
+                        del _workers[self.tool_path]
+                        return
+                    self.requested = False
+                finally:
+                    _workers_lock.release()
+
+    def runNextJob(self):
+        """Run the next queued or stale job and return False if there is none.
+        """
+        connection = self.db.open()
+        try:
+            app = makerequest(connection.root()['Application'])
+            tool = app.unrestrictedTraverse(self.tool_path)
+            job_id = tool._claimNextJob()
+            try:
+                # Also keeps the stale jobs that have been marked as failed
+                transaction.commit()
+            except ConflictError:
+                # Another thread or ZEO client claimed a job at the same time
+                transaction.abort()
+                return True
+            if job_id is None:
+                return False
+            LOG(glog_key, DEBUG, "Running job %s" % job_id)
+            heartbeat = JobHeartbeat(self.db, self.tool_path, job_id)
+            heartbeat.start()
+            try:
+                try:
+                    self.runJob(tool, job_id)
+                except Exception, e:
+                    transaction.abort()
+                    tool._failJob(job_id, '%s: %s' % (e.__class__.__name__, e))
+                    transaction.commit()
+                    raise
+            finally:
+                heartbeat.stop()
+            return True
+        finally:
+            transaction.abort()
+            noSecurityManager()
+            connection.close()
+
+    def runJob(self, tool, job_id):
+        retries = 0
+        while True:
+            try:
+                more = tool._runNextJobCall(job_id)
+                transaction.commit()
+            except ConflictError:
+                transaction.abort()
+                retries += 1
+                if retries > JOB_CONFLICT_RETRIES:
+                    raise
+                continue
+            retries = 0
+            if not more:
+                return
+
+
+class JobHeartbeat(threading.Thread):
+    """Thread showing that a worker is alive while it runs a job, so that the
+    job is not taken as lost during a long call.
+
+    It has its own ZODB connection and only changes the 'alive' entry of the
+    job, which the commits of the calls don't change, so that they don't
+    conflict.
+    """
+
+    def __init__(self, db, tool_path, job_id):
+        threading.Thread.__init__(self, name='Remote controller job %s'
+                                  % job_id)
+        self.setDaemon(True)
+        self.db = db
+        self.tool_path = tool_path
+        self.job_id = job_id
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def run(self):
+        while True:
+            self.stopped.wait(JOB_HEARTBEAT_INTERVAL)
+            if self.stopped.isSet():
+                return
+            try:
+                self.beat()
+            except Exception, e:
+                LOG(glog_key, ERROR, "Error in the heartbeat of job %s: %s"
+                    % (self.job_id, e))
+
+    def beat(self):
+        connection = self.db.open()
+        try:
+            tool = connection.root()['Application'].unrestrictedTraverse(
+                self.tool_path)
+            tool._beatJob(self.job_id)
+            try:
+                transaction.commit()
+            except ConflictError:
+                # Tried again at the next beat
+                transaction.abort()
+        finally:
+            transaction.abort()
+            connection.close()
@@ -94,6 +94,60 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.assertEquals(rpaths, ['workspaces/ws1', 'workspaces/ws2',])
 
 
+    def testListContentInfo(self):
+        workspaces = self.portal.workspaces
+        for i in range(5):
+            workspaces.invokeFactory('Workspace', 'ws%s' % i)
+        result = self.tool.listContentInfo('workspaces', 0, 3)
+        self.assertEquals([item['rpath'] for item in result['items']],
+                          ['workspaces/ws0', 'workspaces/ws1', 'workspaces/ws2'])
+        self.assertEquals(result['next_start'], 3)
+        item = result['items'][0]
+        self.assertEquals(item['id'], 'ws0')
+        self.assertEquals(item['portal_type'], 'Workspace')
+        for key in ('title', 'review_state', 'modified'):
+            self.assert_(item.has_key(key))
+
+        result = self.tool.listContentInfo('workspaces', 3, 3, ['id'])
+        self.assertEquals(result['items'],
+                          [{'rpath': 'workspaces/ws3', 'id': 'ws3'},
+                           {'rpath': 'workspaces/ws4', 'id': 'ws4'}])
+        self.assertEquals(result['next_start'], None)
+
+        self.assertRaises(ValueError, self.tool.listContentInfo,
+                          'workspaces', 0, 3, ['no-such-field'])
+
+
+    def testWalkContent(self):
+        workspaces = self.portal.workspaces
+        workspaces.invokeFactory('Workspace', 'ws0')
+        workspaces.ws0.invokeFactory('Workspace', 'a')
+        workspaces.ws0.a.invokeFactory('Workspace', 'deep')
+        workspaces.ws0.invokeFactory('Workspace', 'b')
+        workspaces.invokeFactory('Workspace', 'ws1')
+        expected = ['workspaces/ws0', 'workspaces/ws0/a',
+                    'workspaces/ws0/a/deep', 'workspaces/ws0/b',
+                    'workspaces/ws1']
+
+        page = self.tool.walkContent('workspaces', -1, 100, '', ['id'])
+        self.assertEquals([item['rpath'] for item in page['items']], expected)
+        self.assertEquals(page['cursor'], None)
+
+        rpaths = []
+        cursor = ''
+        while cursor is not None:
+            page = self.tool.walkContent('workspaces', -1, 2, cursor)
+            self.assert_(len(page['items']) <= 2)
+            rpaths.extend([item['rpath'] for item in page['items']])
+            cursor = page['cursor']
+        self.assertEquals(rpaths, expected)
+
+        page = self.tool.walkContent('workspaces', 2, 100, '', ['id'])
+        self.assertEquals([item['rpath'] for item in page['items']],
+                          ['workspaces/ws0', 'workspaces/ws0/a',
+                           'workspaces/ws0/b', 'workspaces/ws1'])
+
+
     def testCreateAndDeleteDocument(self):
         folder_rpath = 'workspaces'
         proxy_list1 = self.tool.listContent(folder_rpath)
@@ -111,6 +165,98 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.failIf(doc_rpath in proxy_list3)
 
 
+    def testDeleteDocuments(self):
+        tool = self.tool
+        doc1_rpath = tool.createDocument('File', {'Title': "First report"},
+                                         'workspaces')
+        doc2_rpath = tool.createDocument('File', {'Title': "Second report"},
+                                         'workspaces')
+        bad_rpath = 'workspaces/no-such-document'
+
+        result = tool.deleteDocuments([doc1_rpath, bad_rpath, doc2_rpath])
+        self.assertEquals(result[doc1_rpath], True)
+        self.assertEquals(result[doc2_rpath], True)
+        self.assertEquals(result[bad_rpath]['error'], 'not_found')
+        content = tool.listContent('workspaces')
+        self.failIf(doc1_rpath in content)
+        self.failIf(doc2_rpath in content)
+
+
+    def testDeleteDocumentsInDirectory(self):
+        portal = self.portal
+        tool = self.tool
+        wftool = getToolByName(portal, 'portal_workflow')
+        wftool.invokeFactoryFor(portal.workspaces, 'Workspace', 'archives',
+                                Title='Archives')
+        for i in range(3):
+            tool.createDocument('File', {'Title': "Report %s" % i},
+                                'workspaces/archives')
+
+        result = tool.deleteDocumentsInDirectory('workspaces/archives', 2)
+        self.assertEquals(result, {'deleted': 2, 'remaining': 1})
+        self.assertEquals(len(tool.listContent('workspaces/archives')), 1)
+
+        result = tool.deleteDocumentsInDirectory('workspaces/archives')
+        self.assertEquals(result, {'deleted': 1, 'remaining': 0})
+        self.assertEquals(tool.listContent('workspaces/archives'), [])
+        result = tool.deleteDocumentsInDirectory('workspaces/archives')
+        self.assertEquals(result, {'deleted': 0, 'remaining': 0})
+
+
+    def testCreateDocumentIdempotencyKey(self):
+        tool = self.tool
+        data_dict = {'Title': "The company hires"}
+        content = tool.listContent('workspaces')
+        rpath1 = tool.createDocument('News Item', data_dict, 'workspaces',
+                                     idempotency_key='news-1')
+        rpath2 = tool.createDocument('News Item', data_dict, 'workspaces',
+                                     idempotency_key='news-1')
+        self.assertEquals(rpath1, rpath2)
+        self.assertEquals(len(tool.listContent('workspaces')),
+                          len(content) + 1)
+
+        rpath3 = tool.editOrCreateDocument('workspaces/other-news',
+                                           'News Item', data_dict,
+                                           idempotency_key='news-2')
+        self.assertNotEquals(rpath3, rpath1)
+        self.assertEquals(tool.editOrCreateDocument(
+            'workspaces/other-news', 'News Item', data_dict,
+            idempotency_key='news-2'), rpath3)
+        self.assertEquals(len(tool.listContent('workspaces')),
+                          len(content) + 2)
+
+
+    def testTraversalCache(self):
+        data_dict = {'Title': "The report from Monday meeting",
+                     'Description': "Another boring report",
+                     }
+        doc_rpath = self.tool.createDocument('File', data_dict, 'workspaces')
+        proxy = self.tool._restrictedTraverse(doc_rpath)
+        self.assert_(self.tool._restrictedTraverse(doc_rpath) is proxy)
+        self.tool.deleteDocument(doc_rpath)
+        self.assertRaises((KeyError, AttributeError),
+                          self.tool._restrictedTraverse, doc_rpath)
+        # The cache is per user
+        self.logout()
+        self.assertRaises(Unauthorized,
+                          self.tool._restrictedTraverse, 'workspaces')
+
+
+    def testCreateDocuments(self):
+        self.tool.manage_changeProperties(batch_size=2)
+        documents = [('File', {'Title': "Report"}),
+                     ('File', {'Title': "Report"}, 0),
+                     ('No Such Type', {'Title': "Failure"}),
+                     ('News Item', {'Title': "News"}),
+                     ]
+        results = self.tool.createDocuments('workspaces', documents)
+        self.assertEquals(len(results), 4)
+        self.assert_(results[2].has_key('error'))
+        rpaths = [results[i]['rpath'] for i in (1, 0, 3)]
+        self.assertNotEquals(rpaths[0], rpaths[1])
+        self.assertEquals(self.tool.listContent('workspaces'), rpaths)
+
+
     def testDocumentFields(self):
         folder_rpath = 'workspaces'
         proxy_list1 = self.tool.listContent(folder_rpath)
@@ -195,6 +341,31 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.failIf(self.tool.isDocumentLocked(doc_rpath))
 
 
+    def testLockAndUnlockDocuments(self):
+        tool = self.tool
+        doc1_rpath = tool.createDocument('File', {'Title': "First report"},
+                                         'workspaces')
+        doc2_rpath = tool.createDocument('File', {'Title': "Second report"},
+                                         'workspaces')
+        bad_rpath = 'workspaces/no-such-document'
+        tool.lockDocument(doc2_rpath)
+
+        result = tool.lockDocuments([doc1_rpath, doc2_rpath, bad_rpath])
+        self.assert_(result[doc1_rpath])
+        self.assertEquals(result[doc2_rpath], False)
+        self.assertEquals(result[bad_rpath]['error'], 'not_found')
+        self.assert_(tool.isDocumentLocked(doc1_rpath))
+
+        result = tool.unlockDocuments({doc1_rpath: result[doc1_rpath],
+                                       doc2_rpath: '',
+                                       bad_rpath: ''})
+        self.assertEquals(result[doc1_rpath], True)
+        self.assertEquals(result[doc2_rpath], True)
+        self.assertEquals(result[bad_rpath]['error'], 'not_found')
+        self.failIf(tool.isDocumentLocked(doc1_rpath))
+        self.failIf(tool.isDocumentLocked(doc2_rpath))
+
+
     def testEditOrCreateDocument(self):
         folder_rpath = 'workspaces'
         proxy_list1 = self.tool.listContent(folder_rpath)
@@ -298,6 +469,87 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.assertEquals(len(proxy_list4) - 1, len(proxy_list5))
 
 
+    def testPublishDocumentDryRun(self):
+        portal = self.portal
+        tool = self.tool
+        wftool = getToolByName(portal, 'portal_workflow')
+        wftool.invokeFactoryFor(portal.sections, 'Section', 'sub',
+                                Title='Sub')
+        data_dict = {'Title': "The report from Monday meeting",
+                     'Description': "Another boring report",
+                     }
+        doc_rpath = tool.createDocument('File', data_dict, 'workspaces', 0)
+        doc_id = portal.restrictedTraverse(doc_rpath).getId()
+        targets = {'sections': '', 'sections/sub': '', 'sections/nowhere': ''}
+
+        plan = tool.publishDocument(doc_rpath, targets, dry_run=True)
+        self.assertEquals(len(plan), 2)
+        rpaths = [step['rpath'] for step in plan]
+        rpaths.sort()
+        self.assertEquals(rpaths, ['sections/%s' % doc_id,
+                                   'sections/sub/%s' % doc_id])
+        self.assertEquals(tool.getPublishedDocuments(doc_rpath), [])
+
+        published = tool.publishDocument(doc_rpath, targets)
+        published.sort()
+        self.assertEquals(published, rpaths)
+        self.assertEquals(tool.getDocumentState('sections/sub/' + doc_id),
+                          'published')
+
+
+    def testPublishDocuments(self):
+        portal = self.portal
+        tool = self.tool
+        doc1_rpath = tool.createDocument('File', {'Title': "First report"},
+                                         'workspaces')
+        doc2_rpath = tool.createDocument('File', {'Title': "Second report"},
+                                         'workspaces')
+        doc1_id = portal.restrictedTraverse(doc1_rpath).getId()
+        doc2_id = portal.restrictedTraverse(doc2_rpath).getId()
+
+        results = tool.publishDocuments([
+            (doc1_rpath, {'sections': ''}),
+            ('workspaces/no-such-document', {'sections': ''}),
+            (doc2_rpath, {'sections': ''}, True),
+            ])
+        self.assertEquals(results[0], {'rpaths': ['sections/' + doc1_id]})
+        self.assertEquals(results[1]['error'], 'not_found')
+        self.assertEquals(results[2], {'rpaths': ['sections/' + doc2_id]})
+        self.assertEquals(tool.getDocumentState('sections/' + doc1_id),
+                          'published')
+        self.assertEquals(tool.getDocumentState('sections/' + doc2_id),
+                          'pending')
+        # The last published document is at the top
+        self.assertEquals(list(portal.sections.objectIds()[:2]),
+                          [doc2_id, doc1_id])
+
+
+    def testGetDocumentStates(self):
+        tool = self.tool
+        data_dict = {'Title': "The report from Monday meeting",
+                     'Description': "Another boring report",
+                     }
+        doc_rpath = tool.createDocument('File', data_dict, 'workspaces', 0)
+        doc_id = self.portal.restrictedTraverse(doc_rpath).getId()
+        tool.publishDocument(doc_rpath, {'sections': ''})
+        published_rpath = 'sections/' + doc_id
+        bad_rpath = 'sections/no-such-document'
+
+        states = tool.getDocumentStates([doc_rpath, published_rpath,
+                                         'sections', bad_rpath])
+        self.assertEquals(states[doc_rpath], tool.getDocumentState(doc_rpath))
+        self.assertEquals(states[published_rpath], 'published')
+        self.assertEquals(states['sections'], tool.getDocumentState('sections'))
+        self.assertEquals(states[bad_rpath]['error'], 'not_found')
+
+        # The states found in the catalog are the ones of the documents
+        catalog_states = tool._getCatalogStates([doc_rpath, published_rpath,
+                                                 bad_rpath])
+        self.failIf(catalog_states.has_key(bad_rpath))
+        for rpath, state in catalog_states.items():
+            self.assertEquals(state, states[rpath])
+
+
     def testUnpublishDocumentsInSection(self):
         portal = self.portal
         wftool = portal.portal_workflow
@@ -381,6 +633,51 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         comment = reject_events[0]['comments']
         self.assertEqual(comment, 'rejected due to section emptying')
 
+    def testUnpublishDocumentsInSectionCounts(self):
+        rctool = self.tool
+        doc1_rpath = rctool.createDocument('File', {'Title': 'doc1'},
+                                           'workspaces')
+        doc2_rpath = rctool.createDocument('File', {'Title': 'doc2'},
+                                           'workspaces')
+        doc3_rpath = rctool.createDocument('File', {'Title': 'doc3'},
+                                           'workspaces')
+        rctool.publishDocument(doc1_rpath, {'sections': ''})
+        rctool.publishDocument(doc2_rpath, {'sections': ''},
+                               wait_for_approval=True)
+        rctool.publishDocument(doc3_rpath, {'sections': ''})
+
+        counts = rctool.unpublishDocumentsInSection('sections', 1)
+        self.assertEqual(counts['failed'], 0)
+        self.assertEqual(counts['unpublished'] + counts['rejected'], 1)
+        self.assertEqual(counts['remaining'], 2)
+
+        counts = rctool.unpublishDocumentsInSection('sections')
+        self.assertEqual(counts['failed'], 0)
+        self.assertEqual(counts['unpublished'] + counts['rejected'], 2)
+        self.assertEqual(counts['remaining'], 0)
+        self.assertEqual(len(self.portal.sections.contentValues()), 0)
+
+        # A document that cannot be unpublished doesn't count in the limit
+        # nor in the remaining documents
+        rctool.publishDocument(doc1_rpath, {'sections': ''})
+        rctool.publishDocument(doc3_rpath, {'sections': ''})
+        sections = self.portal.sections
+        failing_id = sections.contentIds()[0]
+        wftool = self.portal.portal_workflow
+        def doActionFor(ob, action, **kw):
+            if ob.getId() == failing_id:
+                raise ValueError("Cannot unpublish")
+            return wftool.__class__.doActionFor(wftool, ob, action, **kw)
+        wftool.doActionFor = doActionFor
+        try:
+            counts = rctool.unpublishDocumentsInSection('sections', 1)
+        finally:
+            del wftool.doActionFor
+        self.assertEqual(counts, {'unpublished': 1, 'rejected': 0,
+                                  'failed': 1, 'remaining': 0})
+        self.assertEqual(sections.contentIds(), [failing_id])
+
+
     def testGetDocumentArchivedRevisionsInfo(self):
         wftool = self.portal.portal_workflow
         folder_rpath = 'workspaces'
@@ -431,6 +728,50 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.assertEquals(proxy.getContent().Description(),
                           data_dict['Description'])
 
+    def testSearchDocuments(self):
+        tool = self.tool
+        rpaths = []
+        for i in range(3):
+            data_dict = {'Title': "Report %s" % i,
+                         'Description': "Another boring report",
+                         }
+            rpaths.append(tool.createDocument('News Item', data_dict,
+                                              'workspaces'))
+        query = {'portal_type': 'News Item', 'path': 'workspaces'}
+        result = tool.searchDocuments(query, 'Title', '', 2, 0, ['Title'])
+        self.assertEquals(result['total'], 3)
+        self.assertEquals(result['next_start'], 2)
+        self.assertEquals([item['Title'] for item in result['items']],
+                          ["Report 0", "Report 1"])
+        self.assertEquals(result['items'][0]['rpath'], rpaths[0])
+        self.assert_(result['items'][0].has_key('language'))
+
+        # Paths sent as unicode by XML-RPC, or in the dictionary form
+        for path in (u'workspaces', [u'workspaces'],
+                     {'query': u'workspaces'}):
+            result = tool.searchDocuments({'portal_type': 'News Item',
+                                           'path': path})
+            self.assertEquals(result['total'], 3)
+
+        result = tool.searchDocuments(query, 'Title', '', 2, 2)
+        self.assertEquals(len(result['items']), 1)
+        self.assertEquals(result['next_start'], None)
+
+        result = tool.searchDocuments(query, 'Title', 'reverse', 1, 1,
+                                      ['Title'])
+        self.assertEquals(result['total'], 3)
+        self.assertEquals(result['next_start'], 2)
+        self.assertEquals([item['Title'] for item in result['items']],
+                          ["Report 1"])
+
+        result = tool.searchDocuments({'portal_type': 'News Item',
+                                       'path': 'sections'})
+        self.assertEquals(result['total'], 0)
+
+        self.assertRaises(ValueError, tool.searchDocuments, query, '', '',
+                          10, 0, ['no-such-column'])
+
+
     def testGetDocumentMetadata(self):
         data_dict = {'Title': "The report from Monday meeting",
                      'Description': "Another boring report",
@@ -467,6 +808,34 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         # Validate the Dublin Core values
         self.assertEquals(metadata['dublinCore']['Title'], data_dict['Title'])
         
+    def testGetDocumentsMetadata(self):
+        data_dict = {'Title': "The report from Monday meeting",
+                     'Description': "Another boring report",
+                     }
+        tool = self.tool
+        doc_rpath = tool.createDocument('File', data_dict, 'workspaces', 0)
+        bad_rpath = 'workspaces/no-such-document'
+
+        result = tool.getDocumentsMetadata([doc_rpath, bad_rpath])
+        self.assertEquals(result[doc_rpath], tool.getDocumentMetadata(doc_rpath))
+        self.assertEquals(result[bad_rpath]['error'], 'not_found')
+
+        result = tool.getDocumentsMetadata([doc_rpath], ['title'], ['Title'])
+        self.assertEquals(result[doc_rpath],
+                          {'contentInfo': {'title': data_dict['Title']},
+                           'dublinCore': {'Title': data_dict['Title']}})
+
+        result = tool.getDocumentsMetadata([doc_rpath], [], ['Description'])
+        self.assertEquals(result[doc_rpath],
+                          {'contentInfo': {},
+                           'dublinCore': {'Description':
+                                          data_dict['Description']}})
+
+        self.logout()
+        result = tool.getDocumentsMetadata([doc_rpath])
+        self.assertEquals(result[doc_rpath]['error'], 'unauthorized')
+
+
     def testGetDocumentHistory(self):
         wftool = self.portal.portal_workflow
         folder_rpath = 'workspaces'
@@ -504,6 +873,16 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         history = tool.getDocumentHistory(doc_rpath)
         self.assertEquals(len(history), 10)
 
+    def testGetFoldersTitles(self):
+        ttool = getToolByName(self.portal, 'portal_trees')
+        titles = self.tool._getFoldersTitles()
+        self.assert_(titles.has_key('workspaces'))
+        # The cached titles are used as long as the trees are not modified
+        self.assert_(self.tool._getFoldersTitles() is titles)
+        ttool.objectValues()[0].rebuild()
+        self.failIf(self.tool._getFoldersTitles() is titles)
+
+
     def testAddAndDeleteMember(self):
         tool = self.tool
         mtool = getToolByName(tool, 'portal_membership')
@@ -524,6 +903,95 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.assert_(self.tool.getProductVersion('CPSUtil'))
         self.assert_(self.tool.getProductVersion('CPSRemoteController'))
 
+    def testChunkedUpload(self):
+        from xmlrpclib import Binary
+        from Products.CPSRemoteController.RemoteControllerTool import md5
+        tool = self.tool
+        data_dict = {'Title': "The report from Monday meeting",
+                     'Description': "Another boring report",
+                     }
+        doc_rpath = tool.createDocument('File', data_dict, 'workspaces')
+
+        upload_id = tool.beginUpload('report.txt')
+        self.assertEquals(tool.appendUploadChunk(upload_id, 0,
+                                                 Binary('Hello ')), 6)
+        self.assertEquals(tool.appendUploadChunk(upload_id, 6,
+                                                 Binary('world')), 11)
+        # Resending a chunk overwrites it
+        self.assertEquals(tool.appendUploadChunk(upload_id, 6,
+                                                 Binary('World')), 11)
+        self.assertRaises(ValueError, tool.appendUploadChunk, upload_id, 20,
+                          Binary('!'))
+        info = tool.getUploadInfo(upload_id)
+        self.assertEquals(info['size'], 11)
+        self.assertEquals(info['file_name'], 'report.txt')
+
+        tool.commitUpload(upload_id, doc_rpath)
+        doc = self.portal.restrictedTraverse(doc_rpath).getContent()
+        self.assertEquals(str(doc.file.data), 'Hello World')
+        self.assertEquals(doc.file.title, 'report.txt')
+
+        # Big files are stored as a chain of Pdata records
+        data = ''.join([chr(i % 251) for i in range(300000)])
+        upload_id = tool.beginUpload('big.txt')
+        tool.appendUploadChunk(upload_id, 0, Binary(data))
+        tool.commitUpload(upload_id, doc_rpath)
+        doc = self.portal.restrictedTraverse(doc_rpath).getContent()
+        self.failIf(isinstance(doc.file.data, str))
+        self.assert_(doc.file.data.next is not None)
+        self.assertEquals(str(doc.file.data), data)
+        # Ranges are read in any order across the records
+        for offset, length in ((200000, 70000), (65530, 20), (5, 10),
+                               (299990, 100), (0, 300000)):
+            self.assertEquals(tool._readFileRange(doc.file, offset, length),
+                              data[offset:offset+length])
+
+        # An identical upload doesn't store the file again
+        file = doc.file
+        upload_id = tool.beginUpload('big.txt')
+        tool.appendUploadChunk(upload_id, 0, Binary(data))
+        tool.commitUpload(upload_id, doc_rpath)
+        doc = self.portal.restrictedTraverse(doc_rpath).getContent()
+        self.assert_(doc.file.aq_base is file.aq_base)
+
+        # The stored digest isn't used once the file content changed
+        other_data = data[::-1]
+        doc.file.manage_upload(other_data)
+        self.assertEquals(tool.getDocumentFileDigest(doc_rpath),
+                          md5(other_data).hexdigest())
+
+        upload_id = tool.beginUpload('other.txt')
+        tool.abortUpload(upload_id)
+        self.assertRaises(KeyError, tool.getUploadInfo, upload_id)
+
+
+    def testGetDocumentFile(self):
+        from xmlrpclib import Binary
+        from Products.CPSRemoteController.RemoteControllerTool import md5
+        tool = self.tool
+        content = 'Hello World'
+        data_dict = {'Title': "The report from Monday meeting",
+                     'file_name': 'report.txt',
+                     'file': Binary(content),
+                     }
+        doc_rpath = tool.createDocument('File', data_dict, 'workspaces')
+
+        res = tool.getDocumentFile(doc_rpath, 'file', 0, 5)
+        self.assertEquals(res['data'].data, 'Hello')
+        self.assertEquals(res['offset'], 0)
+        self.assertEquals(res['size'], len(content))
+        self.assertEquals(res['digest'], md5(content).hexdigest())
+        self.assertEquals(res['file_name'], 'report.txt')
+
+        res = tool.getDocumentFile(doc_rpath, 'file', 6, 100)
+        self.assertEquals(res['data'].data, 'World')
+        res = tool.getDocumentFile(doc_rpath, 'file', 100, 100)
+        self.assertEquals(res['data'].data, '')
+
+        self.assertRaises(ValueError, tool.getDocumentFile, doc_rpath,
+                          'no_such_file')
+
+
     def testCreateAndDeleteDocumentUnicodeFeed(self):
         folder_rpath = u'workspaces'
         proxy_list1 = self.tool.listContent(folder_rpath)
@@ -545,6 +1013,8 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.assert_(len(tree), 1)
         self.assertEquals(tree[0]['id'], 'sections')
         self.assertEquals(tree[0]['can_publish'], True)
+        # The tree is cached as long as the sections are not modified
+        self.assert_(self.tool.getSectionsTree() is tree)
 
     def testGetPublishedOrPendingDocuments(self):
         portal = self.portal
@@ -717,6 +1187,61 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         self.assertEqual(doc.Description(), doc_def['Description'])
 
 
+    def testEditDocumentIdenticalFile(self):
+        from xmlrpclib import Binary
+        from Products.CPSRemoteController.RemoteControllerTool import md5
+        tool = self.tool
+        data_dict = {'Title': "The report from Monday meeting",
+                     'file_name': 'report.txt',
+                     'file': Binary('Hello World'),
+                     }
+        doc_rpath = tool.createDocument('File', data_dict, 'workspaces')
+        proxy = self.portal.restrictedTraverse(doc_rpath)
+        self.assertEquals(tool.getDocumentFileDigest(doc_rpath),
+                          md5('Hello World').hexdigest())
+        self.assertEquals(tool.getDocumentFileDigest(doc_rpath, 'no_file'), '')
+
+        file = proxy.getContent().file
+        tool.editDocument(doc_rpath, {'file_name': 'report.txt',
+                                      'file': Binary('Hello World')})
+        self.assert_(proxy.getContent().file.aq_base is file.aq_base)
+
+        tool.editDocument(doc_rpath, {'file_name': 'report.txt',
+                                      'file': Binary('Hello again')})
+        self.failIf(proxy.getContent().file.aq_base is file.aq_base)
+        self.assertEquals(tool.getDocumentFileDigest(doc_rpath),
+                          md5('Hello again').hexdigest())
+
+
+    def testEditDocumentOnlyChanged(self):
+        tool = self.tool
+        data_dict = {'Title': "The report from Monday meeting",
+                     'Description': "Another boring report",
+                     }
+        doc_rpath = tool.createDocument('File', data_dict, 'workspaces')
+        proxy = self.portal.restrictedTraverse(doc_rpath)
+
+        changed = tool.editDocument(doc_rpath,
+                                    {'Title': data_dict['Title'],
+                                     'Description': "A new description"},
+                                    only_changed=True)
+        self.assertEquals(changed, ['Description'])
+        doc = proxy.getContent()
+        self.assertEquals(doc.Title(), data_dict['Title'])
+        self.assertEquals(doc.Description(), "A new description")
+
+        modified = doc.modified()
+        changed = tool.editDocument(doc_rpath,
+                                    {'Title': data_dict['Title'],
+                                     'Description': "A new description"},
+                                    only_changed=True)
+        self.assertEquals(changed, [])
+        self.assertEquals(proxy.getContent().modified(), modified)
+
+        changed = tool.editDocument(doc_rpath, {'Title': data_dict['Title']})
+        self.assertEquals(changed, ['Title'])
+
+
     def testGetPublishedDocuments(self):
         portal = self.portal
         rctool = self.tool
@@ -803,6 +1328,206 @@ class ProductTestCase(CPSRemoteControllerTestCase):
         entries = self.tool.getVocabularyEntries('subject_voc')
         self.assert_(('Arts', 'Arts') in entries)
 
+    def testMulticall(self):
+        data_dict = {'Title': "The report from Monday meeting",
+                     'Description': "Another boring report",
+                     }
+        doc_rpath = self.tool.createDocument('File', data_dict, 'workspaces')
+        results = self.tool.multicall([
+            ('getDocumentState', [doc_rpath]),
+            ('isDocumentLocked', [doc_rpath]),
+            ('getDocumentState', ['workspaces/no-such-document']),
+            ('_restrictedTraverse', [doc_rpath]),
+            ('manage_delObjects', [[doc_rpath.split('/')[-1]]]),
+            ])
+        self.assertEquals(len(results), 5)
+        self.assertEquals(results[0], [self.tool.getDocumentState(doc_rpath)])
+        self.assertEquals(results[1], [False])
+        for fault in results[2:]:
+            self.assert_(isinstance(fault, dict))
+            self.assert_(fault.has_key('faultCode'))
+            self.assert_(fault.has_key('faultString'))
+        # The document was not deleted through the non API method
+        self.assert_(doc_rpath in self.tool.listContent('workspaces'))
+
+        # check anonymous access
+        self.logout()
+        results = self.tool.multicall([('getRoles', [MANAGER_ID])])
+        self.assert_(results[0].has_key('faultCode'))
+
+    def testJobs(self):
+        from Products.CPSRemoteController import RemoteControllerTool as module
+        from DateTime import DateTime
+        tool = self.tool
+        # No worker thread against the test database
+        start_worker = module.startWorker
+        started = []
+        module.startWorker = lambda db, tool_path: started.append(tool_path)
+        try:
+            doc_rpath = tool.createDocument('File', {'Title': "A report"},
+                                            'workspaces')
+            job_id = tool.submitJob([('getDocumentState', [doc_rpath]),
+                                     ('getDocumentState', ['workspaces/nodoc'])])
+            info = tool.getJobInfo(job_id)
+            self.assertEquals(info['status'], 'queued')
+            self.assertEquals((info['done'], info['total']), (0, 2))
+            self.assertEquals(len(started), 1)
+            self.assertRaises(ValueError, tool.getJobResult, job_id)
+            self.assertRaises(Unauthorized, tool.submitJob,
+                              [('_getJobs', [])])
+
+            # Run the job the way the worker thread does, without the commits
+            self.assertEquals(tool._claimNextJob(), job_id)
+            self.assertEquals(tool._claimNextJob(), None)
+            self.assert_(tool._runNextJobCall(job_id))
+            self.assertEquals(tool.getJobInfo(job_id)['done'], 1)
+
+            # A long call doesn't make the job stale while its worker is alive
+            job = tool._getJob(job_id)
+            job['heartbeat'] = DateTime() - 1
+            tool._beatJob(job_id)
+            self.failIf(tool._isStaleJob(job))
+            self.assertEquals(tool._claimNextJob(), None)
+
+            # A job whose worker was lost is claimed again, then fails
+            job['alive']['time'] = None
+            tool.getJobInfo(job_id)
+            self.assertEquals(len(started), 2)
+            self.assertEquals(tool._claimNextJob(), job_id)
+            self.assertEquals(job['attempts'], 2)
+            self.failIf(tool._runNextJobCall(job_id))
+
+            info = tool.getJobInfo(job_id)
+            self.assertEquals(info['status'], 'done')
+            self.assert_(info['finished'])
+            results = tool.getJobResult(job_id)
+            self.assertEquals(results[0], [tool.getDocumentState(doc_rpath)])
+            self.assert_(results[1].has_key('faultCode'))
+
+            job_id = tool.submitJob([('getDocumentState', [doc_rpath])])
+            job = tool._getJob(job_id)
+            job['status'] = 'running'
+            job['attempts'] = module.JOB_MAX_ATTEMPTS
+            job['heartbeat'] = DateTime() - 1
+            self.assertEquals(tool._claimNextJob(), None)
+            self.assertEquals(tool.getJobInfo(job_id)['status'], 'failed')
+        finally:
+            module.startWorker = start_worker
+
+
+    def testConflictStatistics(self):
+        from ZODB.POSException import ConflictError
+        tool = self.tool
+        def conflict():
+            raise ConflictError
+
+        # The metadata recorded by the publisher are kept for the next try
+        import transaction
+        txn = transaction.get()
+        txn.note('/portal/portal_remote_controller/createDocument')
+        txn.setExtendedInfo('method', 'createDocument')
+        tool._abortKeepingMetadata()
+        retry_txn = transaction.get()
+        self.assertEquals(retry_txn.description, txn.description)
+        self.assertEquals(retry_txn.user, txn.user)
+        self.assertEquals(retry_txn._extension['method'], 'createDocument')
+
+        # Not in a request publishing the method, so there is no retry
+        self.assertRaises(ConflictError, tool._runChange, 'createDocument',
+                          ['workspaces'], conflict)
+        statistics = tool.getConflictStatistics()['createDocument']
+        self.assert_(statistics['conflicts'] >= 1)
+        self.assert_(statistics['failures'] >= 1)
+        self.assert_(statistics['containers']['workspaces'] >= 1)
+        self.assertEquals(tool._runChange('createDocument', ['workspaces'],
+                                          lambda x: x, 1), 1)
+
+        # The conflicts at the commit of the caller are counted as well
+        conflicts = statistics['conflicts']
+        hook = list(transaction.get().getAfterCommitHooks())[-1][0]
+        try:
+            raise ConflictError
+        except ConflictError:
+            hook(False)
+        hook(True)
+        statistics = tool.getConflictStatistics()['createDocument']
+        self.assertEquals(statistics['conflicts'], conflicts + 1)
+
+
+    def testGetChangesSince(self):
+        from Products.CPSRemoteController import RemoteControllerTool as module
+        import time
+        import transaction
+        tool = self.tool
+        current_seq = tool.getChangesSince('', 0)['current_seq']
+        settle_delay = module.CHANGES_SETTLE_DELAY
+        module.CHANGES_SETTLE_DELAY = -60
+        try:
+            doc_rpath = tool.createDocument('File', {'Title': "A report"},
+                                            'workspaces')
+            proxy = self.portal.restrictedTraverse(doc_rpath)
+            # Called directly as well, not to depend on the subscriptions
+            tool.notify_changes('workflow_modify', proxy, {})
+            tool.notify_changes('workflow_modify', proxy.getContent(), {})
+            # The changes rolled back to a savepoint are dropped
+            savepoint = transaction.savepoint()
+            tool._recordChange('workspaces/rolled-back', 'workflow_delete')
+            savepoint.rollback()
+            # Done when the transaction is committed
+            tool._writeChanges()
+
+            result = tool.getChangesSince(current_seq, 1000)
+            self.failIf(result['reset'])
+            self.assert_(result['last_seq'] > current_seq)
+            self.assertEquals(result['current_seq'], result['last_seq'])
+            # Only the last change of an rpath in a transaction is kept
+            changes = [change for change in result['changes']
+                       if change['rpath'] == doc_rpath]
+            self.assertEquals(len(changes), 1)
+            self.assertEquals(changes[0]['event_type'], 'workflow_modify')
+
+            first = tool.getChangesSince(current_seq, 1)
+            self.assertEquals(first['changes'], result['changes'][:1])
+            following = tool.getChangesSince(first['last_seq'], 1000)
+            self.assertEquals(following['changes'], result['changes'][1:])
+            self.failIf('workspaces/rolled-back' in
+                        [change['rpath'] for change in result['changes']])
+
+            # Clients that may have missed changes committed late start again
+            tool._recordLateChanges(result['changes'][0]['seq'],
+                                    time.time() + 3600)
+            self.assert_(tool.getChangesSince(result['last_seq'], 0)['reset'])
+            self.failIf(tool.getChangesSince(current_seq, 0)['reset'])
+        finally:
+            module.CHANGES_SETTLE_DELAY = settle_delay
+        # The changes that may not be settled are not returned yet
+        self.assertEquals(tool.getChangesSince(current_seq)['changes'], [])
+
+
+    def testGetVersionedVocabularyEntries(self):
+        res = self.tool.getVersionedVocabularyEntries('subject_voc')
+        self.assertEquals(res['entries'],
+                          self.tool.getVocabularyEntries('subject_voc'))
+        version = res['version']
+        res = self.tool.getVersionedVocabularyEntries('subject_voc', version)
+        self.assertEquals(res, {'version': version, 'not_modified': True})
+        res = self.tool.getVersionedVocabularyEntries('subject_voc', 'old')
+        self.assertEquals(res['version'], version)
+        self.assert_(res.has_key('entries'))
+
+    def testGetVersionedSectionsTree(self):
+        res = self.tool.getVersionedSectionsTree()
+        self.assertEquals(res['tree'][0]['id'], 'sections')
+        version = res['version']
+        res = self.tool.getVersionedSectionsTree(version)
+        self.assertEquals(res, {'version': version, 'not_modified': True})
+
+        # The version doesn't depend on the order of the nested dictionaries
+        self.assertEquals(
+            self.tool._getCanonicalRepr([{'b': [{'y': 1, 'x': (2,)}],
+                                          'a': u'A'}]),
+            "[{'a': u'A', 'b': [{'x': [2], 'y': 1}]}]")
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(ProductTestCase))
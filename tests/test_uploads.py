@@ -0,0 +1,69 @@
+# (C) Copyright 2012 Nuxeo SAS <http://nuxeo.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+# $Id$
+
+import doctest
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from Products.CPSRemoteController.uploads import UploadStore
+
+if __name__ == '__main__':
+    execfile(os.path.join(sys.path[0], 'framework.py'))
+
+
+class UploadStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = UploadStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_invalid_upload_id(self):
+        self.assertRaises(KeyError, self.store.getInfo, '../etc/passwd',
+                          'john')
+
+    def test_non_ascii_file_name(self):
+        upload_id = self.store.begin(u'john', u'r\xe9union\n.pdf')
+        info = self.store.getInfo(upload_id, 'john')
+        self.assertEquals(info['file_name'], u'r\xe9union .pdf')
+
+    def test_removeExpired(self):
+        old_id = self.store.begin('john', 'old.txt')
+        new_id = self.store.begin('john', 'new.txt')
+        old_path = os.path.join(self.directory, old_id + '.data')
+        past = time.time() - 3600
+        os.utime(old_path, (past, past))
+        self.store.removeExpired(60)
+        self.assertRaises(KeyError, self.store.getInfo, old_id, 'john')
+        self.assertEquals(self.store.getInfo(new_id, 'john')['size'], 0)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(UploadStoreTestCase))
+    suite.addTest(doctest.DocTestSuite('Products.CPSRemoteController.uploads'))
+    return suite
+
+if __name__ == '__main__':
+    framework(descriptions=1, verbosity=2)
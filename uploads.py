@@ -0,0 +1,192 @@
+# (C) Copyright 2012 Nuxeo SAS <http://nuxeo.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA
+# 02111-1307, USA.
+#
+# $Id$
+"""Staging area for the files uploaded in chunks to the remote controller.
+
+The chunks are appended to a file on disk, so that the memory used doesn't
+depend on the size of the uploaded file. Each upload has a data file and an
+info file holding the id of its owner and the name of the uploaded file.
+
+    >>> import tempfile, shutil
+    >>> directory = tempfile.mkdtemp()
+    >>> store = UploadStore(directory)
+    >>> upload_id = store.begin('john', 'report.pdf')
+    >>> store.append(upload_id, 'john', 0, 'Hello ')
+    6
+    >>> store.append(upload_id, 'john', 6, 'world')
+    11
+
+Sending again a chunk that was already received, for example because the
+response was lost, overwrites the data from the given offset:
+
+    >>> store.append(upload_id, 'john', 6, 'World')
+    11
+    >>> info = store.getInfo(upload_id, 'john')
+    >>> info['size'], info['file_name']
+    (11, u'report.pdf')
+    >>> f = store.open(upload_id, 'john')
+    >>> f.read()
+    'Hello World'
+    >>> f.close()
+
+The file names are returned as unicode, whatever their characters:
+
+    >>> other_id = store.begin('john', u'r\\xe9union.pdf')
+    >>> store.getInfo(other_id, 'john')['file_name']
+    u'r\\xe9union.pdf'
+    >>> store.remove(other_id)
+
+Only the owner can access an upload:
+
+    >>> store.getInfo(upload_id, 'jane') # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    KeyError: 'No upload ... for jane'
+
+    >>> store.remove(upload_id)
+    >>> store.getInfo(upload_id, 'john') # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    KeyError: 'No upload ... for john'
+    >>> shutil.rmtree(directory)
+"""
+
+import os
+import time
+from binascii import hexlify
+
+# Uploads not modified since this number of seconds are removed
+UPLOAD_MAX_AGE = 24 * 3600
+
+# Encoding of the info files
+INFO_ENCODING = 'utf-8'
+
+DATA_SUFFIX = '.data'
+INFO_SUFFIX = '.info'
+
+
+class UploadStore(object):
+    """Files uploaded in chunks, staged in the given directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def begin(self, owner, file_name):
+        """Start a new upload and return its id.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.removeExpired()
+        upload_id = hexlify(os.urandom(16))
+        # Names are stored on one line
+        file_name = _encode(file_name).replace('\n', ' ')
+        self._write(upload_id + INFO_SUFFIX,
+                    '%s\n%s' % (_encode(owner), file_name))
+        self._write(upload_id + DATA_SUFFIX, '')
+        return upload_id
+
+    def append(self, upload_id, owner, offset, data):
+        """Write the given chunk of data at the given offset and return the
+        size of the upload.
+
+        The offset cannot be beyond the current size of the upload, so the
+        chunks have to be sent in order.
+        """
+        size = self.getInfo(upload_id, owner)['size']
+        if offset < 0 or offset > size:
+            raise ValueError("Invalid offset %s for upload %s of size %s"
+                             % (offset, upload_id, size))
+        f = open(self._getPath(upload_id + DATA_SUFFIX), 'r+b')
+        try:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+            size = f.tell()
+        finally:
+            f.close()
+        return size
+
+    def getInfo(self, upload_id, owner):
+        """Return a dictionary with the 'size' and 'file_name' of the upload,
+        the file name being unicode.
+        """
+        info_path = self._getPath(upload_id + INFO_SUFFIX)
+        try:
+            f = open(info_path, 'rb')
+            try:
+                upload_owner, file_name = f.read().split('\n', 1)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            upload_owner = None
+        if upload_owner != _encode(owner):
+            raise KeyError("No upload %s for %s" % (upload_id, owner))
+        size = os.path.getsize(self._getPath(upload_id + DATA_SUFFIX))
+        return {'size': size, 'file_name': file_name.decode(INFO_ENCODING)}
+
+    def open(self, upload_id, owner):
+        """Return the uploaded data as a file object opened for reading.
+        """
+        self.getInfo(upload_id, owner)
+        return open(self._getPath(upload_id + DATA_SUFFIX), 'rb')
+
+    def remove(self, upload_id):
+        """Remove the upload, if it exists.
+        """
+        for suffix in (DATA_SUFFIX, INFO_SUFFIX):
+            try:
+                os.remove(self._getPath(upload_id + suffix))
+            except OSError:
+                pass
+
+    def removeExpired(self, max_age=UPLOAD_MAX_AGE):
+        """Remove the uploads that have not been modified for max_age seconds.
+        """
+        limit = time.time() - max_age
+        for name in os.listdir(self.directory):
+            upload_id, suffix = os.path.splitext(name)
+            if suffix != INFO_SUFFIX:
+                continue
+            # The data file is the one modified by each chunk
+            try:
+                mtime = os.path.getmtime(self._getPath(upload_id + DATA_SUFFIX))
+            except (OSError, KeyError):
+                mtime = 0
+            if mtime < limit:
+                self.remove(upload_id)
+
+    def _getPath(self, name):
+        # Upload ids come from the clients, so they must not be used to
+        # reach files outside of the directory.
+        upload_id = name.split('.')[0]
+        if not upload_id.isalnum():
+            raise KeyError("Invalid upload id %s" % upload_id)
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, data):
+        f = open(self._getPath(name), 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode(INFO_ENCODING)
+    return value